@@ -6,7 +6,7 @@ import ipywidgets as ipw
 from IPython.display import clear_output
 from traitlets import Bool, Dict, Instance, Unicode, Union, dlink, link, validate
 
-from aiida.orm import Code, Computer, QueryBuilder, User
+from aiida.orm import AuthInfo, Code, Computer, QueryBuilder, User
 from aiida.plugins.entry_point import get_entry_point_names
 from aiidalab_widgets_base.computers import ComputerDropdown
 
@@ -48,6 +48,9 @@ class CodeDropdown(ipw.VBox):
 
         self.input_plugin = input_plugin
 
+        # Code labels indexed by code pk, filled in by `refresh`.
+        self._code_labels = {}
+
         self.dropdown = ipw.Dropdown(description=description, disabled=True, value=None)
         link((self, "codes"), (self.dropdown, "options"))
         link((self.dropdown, "value"), (self, "selected_code"))
@@ -89,14 +92,33 @@ class CodeDropdown(ipw.VBox):
 
         user = User.objects.get_default()
 
+        # Computers configured (and, if required, enabled) for the current user.
+        computers = [
+            computer_id
+            for computer_id, enabled in QueryBuilder()
+            .append(
+                AuthInfo,
+                filters={"aiidauser_id": user.id},
+                project=["dbcomputer_id", "enabled"],
+            )
+            .all()
+            if enabled or self.allow_disabled_computers
+        ]
+        if not computers:
+            return {}
+
         return {
             self._full_code_label(c[0]): c[0]
             for c in QueryBuilder()
-            .append(Code, filters={"attributes.input_plugin": self.input_plugin})
+            .append(
+                Code,
+                filters={
+                    "attributes.input_plugin": self.input_plugin,
+                    "dbcomputer_id": {"in": computers},
+                },
+            )
             .all()
-            if c[0].computer.is_user_configured(user)
-            and (self.allow_hidden_codes or not c[0].hidden)
-            and (self.allow_disabled_computers or c[0].computer.is_user_enabled(user))
+            if self.allow_hidden_codes or not c[0].hidden
         }
 
     @staticmethod
@@ -110,8 +132,10 @@ class CodeDropdown(ipw.VBox):
         put them in the dropdown attribute."""
         self.output.value = ""
 
+        codes = self._get_codes()
+        self._code_labels = {code.pk: label for label, code in codes.items()}
         with self.hold_trait_notifications():
-            self.dropdown.options = self._get_codes()
+            self.dropdown.options = codes
         if not self.dropdown.options:
             self.output.value = (
                 f"No codes found for input plugin '{self.input_plugin}'."
@@ -141,8 +165,7 @@ class CodeDropdown(ipw.VBox):
 
         # Check code by value.
         if isinstance(code, Code):
-            label = self._full_code_label(code)
-            if label in self.codes:
+            if self._code_labels.get(code.pk) in self.codes:
                 return code
             self.output.value = f"""The code instance '<span style="color:red">{code}</span>'
             supplied was not found in the AiiDA database."""
@@ -1,4 +1,6 @@
 """Widgets that allow to query online databases."""
+import re
+
 import requests
 import ipywidgets as ipw
 from traitlets import Bool, Float, Instance, Int, Unicode, default, observe
@@ -9,6 +11,10 @@ from optimade_client.query_provider import OptimadeQueryProviderWidget
 
 from aiida.tools.dbimporters.plugins.cod import CodDbImporter
 
+CIF_FORMULA_SUM = re.compile(
+    r"^_chemical_formula_sum\s+(['\"]?)(.+?)\1\s*$", re.MULTILINE
+)
+
 
 class CodQueryWidget(ipw.VBox):
     """Query structures in Crystallography Open Database (COD)
@@ -39,6 +45,7 @@ class CodQueryWidget(ipw.VBox):
     """
         )
         self.title = title
+        self._importer = CodDbImporter()
         layout = ipw.Layout(width="400px")
         style = {"description_width": "initial"}
         self.inp_elements = ipw.Text(
@@ -68,16 +75,22 @@ class CodQueryWidget(ipw.VBox):
         ]
         super(CodQueryWidget, self).__init__(children=children, **kwargs)
 
-    @staticmethod
-    def _query(idn=None, formula=None):
+    def _query(self, idn=None, formula=None):
         """Make the actual query."""
-        importer = CodDbImporter()
         if idn is not None:
-            return importer.query(id=idn)
+            return self._importer.query(id=idn)
         if formula is not None:
-            return importer.query(formula=formula)
+            return self._importer.query(formula=formula)
         return None
 
+    @staticmethod
+    def _get_formula(cif):
+        """Read the formula from the CIF header, parse the structure only if it is missing."""
+        match = CIF_FORMULA_SUM.search(cif.get_content())
+        if match:
+            return "".join(match.group(2).split())
+        return cif.get_ase().get_chemical_formula()
+
     def _on_click_query(self, change):  # pylint: disable=unused-argument
         """Call query when the corresponding button is pressed."""
         structures = [("select structure", {"status": False})]
@@ -92,7 +105,7 @@ class CodQueryWidget(ipw.VBox):
         for entry in self._query(idn=idn, formula=formula):
             try:
                 entry_cif = entry.get_cif_node()
-                formula = entry_cif.get_ase().get_chemical_formula()
+                formula = self._get_formula(entry_cif)
             except:  # noqa: E722
                 continue
             entry_add = (
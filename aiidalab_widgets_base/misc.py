@@ -1,9 +1,34 @@
 """Some useful classes used acrross the repository."""
-import io
-import tokenize
+import json
+import re
+from functools import lru_cache
+
 import ipywidgets as ipw
 from traitlets import Unicode
 
+# Lists in square brackets, numbers, names, two-character comparison operators and any
+# other single character.
+TOKEN = re.compile(r"\[[^\]]*\]|(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|\w+|[<>=!]=|\S")
+
+COPY_TO_CLIPBOARD_JS = """
+function copyStringToClipboard (str) {
+    // Create new element
+    var el = document.createElement('textarea');
+    // Set value (string to be copied)
+    el.value = str;
+    // Set non-editable to avoid focus and move outside of view
+    el.setAttribute('readonly', '');
+    el.style = {position: 'absolute', left: '-9999px'};
+    document.body.appendChild(el);
+    // Select text inside element
+    el.select();
+    // Copy text to clipboard
+    document.execCommand('copy');
+    // Remove temporary element
+    document.body.removeChild(el);
+}
+"""
+
 
 class CopyToClipboardButton(ipw.Button):
     """Button to copy text to clipboard."""
@@ -18,31 +43,14 @@ class CopyToClipboardButton(ipw.Button):
         """Copy text to clipboard."""
         from IPython.display import Javascript, display
 
-        javas = Javascript(
-            """
-           function copyStringToClipboard (str) {{
-               // Create new element
-               var el = document.createElement('textarea');
-               // Set value (string to be copied)
-               el.value = str;
-               // Set non-editable to avoid focus and move outside of view
-               el.setAttribute('readonly', '');
-               el.style = {{position: 'absolute', left: '-9999px'}};
-               document.body.appendChild(el);
-               // Select text inside element
-               el.select();
-               // Copy text to clipboard
-               document.execCommand('copy');
-               // Remove temporary element
-               document.body.removeChild(el);
-            }}
-            copyStringToClipboard("{selection}");
-       """.format(
-                selection=self.value
-            )
-        )  # For the moment works for Chrome, but doesn't work for Firefox.
         if self.value:  # If no value provided - do nothing.
-            display(javas)
+            # For the moment works for Chrome, but doesn't work for Firefox.
+            display(
+                Javascript(
+                    COPY_TO_CLIPBOARD_JS
+                    + f"copyStringToClipboard({json.dumps(self.value)});"
+                )
+            )
 
 
 class ReversePolishNotation:
@@ -55,6 +63,9 @@ class ReversePolishNotation:
     def __init__(self, operators, additional_operands=None):
         self.operators = operators
         self.additional_operands = additional_operands
+        self._priorities = {
+            name: operator["priority"] for name, operator in operators.items()
+        }
 
     def haslessorequalpriority(self, opa, opb):
         """Priority of the different operators"""
@@ -80,21 +91,26 @@ class ReversePolishNotation:
 
     def convert(self, expr):
         """Convert expression to postfix."""
+        priorities = self._priorities
         stack = []
         output = []
         for char in expr:
-            if self.is_operator(char) or char in ["(", ")"]:
-                if self.isopenparenthesis(char):
-                    stack.append(char)
-                elif self.iscloseparenthesis(char):
+            if char == "(":
+                stack.append(char)
+            elif char == ")":
+                operator = stack.pop()
+                while operator != "(":
+                    output.append(operator)
                     operator = stack.pop()
-                    while not self.isopenparenthesis(operator):
-                        output.append(operator)
-                        operator = stack.pop()
-                else:
-                    while stack and self.haslessorequalpriority(char, stack[-1]):
-                        output.append(stack.pop())
-                    stack.append(char)
+            elif char in priorities:
+                priority = priorities[char]
+                while (
+                    stack
+                    and stack[-1] in priorities
+                    and priority <= priorities[stack[-1]]
+                ):
+                    output.append(stack.pop())
+                stack.append(char)
             else:
                 output.append(char)
         while stack:
@@ -104,63 +120,112 @@ class ReversePolishNotation:
     @staticmethod
     def parse_infix_notation(condition):
         """Convert a string containing the expression into a list of operators and operands."""
-        condition = [
-            token[1]
-            for token in tokenize.generate_tokens(
-                io.StringIO(condition.strip()).readline
-            )
-            if token[1]
+        # Lists are kept as a single operand, without whitespaces.
+        return [
+            "".join(token.split()) if token.startswith("[") else token
+            for token in TOKEN.findall(condition)
         ]
 
-        result = []
-        open_bracket = False
-
-        # Merging lists.
-        for element in condition:
-            if element == "[":
-                res = "["
-                open_bracket = True
-            elif element == "]":
-                res += "]"
-                result.append(res)
-                open_bracket = False
-            elif open_bracket:
-                res += element
-            else:
-                result.append(element)
-        return result
+    def compile(self, expression):
+        """Compile the provided expression into a code object and the constants it uses."""
+        return _compile_expression(
+            expression,
+            tuple(
+                (
+                    name,
+                    operator["priority"],
+                    operator["nargs"],
+                    "short_circuit" in operator,
+                )
+                for name, operator in self.operators.items()
+            ),
+            tuple(self.additional_operands or ()),
+        )
 
     def execute(self, expression):
         """Execute the provided expression."""
 
-        def is_number(string):
-            """Check if string is a number. """
-            try:
-                float(string)
-                return True
-            except ValueError:
-                return False
+        def short_circuit(operator):
+            """Evaluate the right operand only if the left one doesn't decide the result."""
+
+            def apply(left, right):
+                if operator["short_circuit"](left):
+                    return left
+                return operator["function"](left, right())
+
+            return apply
+
+        code, constants = self.compile(expression)
+        return eval(  # pylint: disable=eval-used
+            code,
+            {
+                "__builtins__": {},
+                "_c": constants,
+                "_f": {
+                    name: operator["function"]
+                    for name, operator in self.operators.items()
+                },
+                "_o": self.additional_operands,
+                "_s": {
+                    name: short_circuit(operator)
+                    for name, operator in self.operators.items()
+                    if "short_circuit" in operator
+                },
+            },
+        )
+
+
+@lru_cache(maxsize=256)
+def _compile_expression(expression, operators, operands):
+    """Translate an expression into a Python expression and compile it.
+
+    The numbers are stored in the `_c` tuple, operators are called from the `_f`
+    dictionary and additional operands are taken from the `_o` dictionary. Binary
+    operators that define a `short_circuit` predicate are called from the `_s`
+    dictionary instead, with the right operand wrapped in a lambda, so that it is only
+    evaluated when needed.
+
+    The result only depends on the expression text, the operators' names, priorities
+    and number of arguments, and the names of the additional operands, so it is cached
+    on those. The operator functions and the operand values are provided at execution
+    time."""
+
+    def is_number(string):
+        """Check if string is a number."""
+        try:
+            float(string)
+            return True
+        except ValueError:
+            return False
 
-        stack = []
-        stackposition = -1
-        infix_expression = self.parse_infix_notation(expression)
-        for ope in self.convert(infix_expression):
-            # Operands.
-            if is_number(ope):
-                stack.append(float(ope))
-                stackposition += 1
-            elif ope in self.operators:
-                nargs = self.operators[ope]["nargs"]
-                arguments = [
-                    stack[stackposition + indx] for indx in list(range(-nargs + 1, 1))
-                ]
-                stack[stackposition] = self.operators[ope]["function"](*arguments)
-                del stack[stackposition - nargs + 1 : stackposition]
-                stackposition -= nargs - 1
+    rpn = ReversePolishNotation(
+        operators={
+            name: {"priority": priority, "nargs": nargs}
+            for name, priority, nargs, _ in operators
+        }
+    )
+    nargs = {name: nargs for name, _, nargs, _ in operators}
+    short_circuit = {
+        name for name, _, nargs, short in operators if short and nargs == 2
+    }
+    constants = []
+    stack = []
+    for ope in rpn.convert(rpn.parse_infix_notation(expression)):
+        if is_number(ope):
+            stack.append(f"_c[{len(constants)}]")
+            constants.append(float(ope))
+        elif ope in nargs:
+            if len(stack) < nargs[ope]:
+                raise IndexError(f"Not enough arguments for the operator '{ope}'.")
+            arguments = stack[-nargs[ope] :]
+            del stack[-nargs[ope] :]
+            if ope in short_circuit:
+                stack.append(f"_s[{ope!r}]({arguments[0]}, lambda: {arguments[1]})")
             else:
-                if self.additional_operands and ope in self.additional_operands:
-                    stack.append(self.additional_operands[ope])
-                else:
-                    stack.append(ope)
-                stackposition += 1
-        return stack[0] if stack else []
+                stack.append(f"_f[{ope!r}]({', '.join(arguments)})")
+        elif ope in operands:
+            stack.append(f"_o[{ope!r}]")
+        else:
+            stack.append(repr(ope))
+    source = stack[0] if stack else "[]"
+    return compile(source, "<rpn>", "eval"), tuple(constants)
@@ -1,18 +1,20 @@
 """Widgets to work with processes."""
 # pylint: disable=no-self-use
 # Built-in imports
+import asyncio
 import os
+import re
 import warnings
+from datetime import timedelta
+from functools import lru_cache
 from inspect import isclass
 from inspect import signature
 from threading import Event
 from threading import Lock
 from threading import Thread
-from time import sleep
 
 # External imports
 import ipywidgets as ipw
-import pandas as pd
 import traitlets
 from IPython.display import HTML, Javascript, clear_output, display
 from traitlets import Instance, Int, List, Unicode, Union, default, observe, validate
@@ -20,13 +22,15 @@ from traitlets import Instance, Int, List, Unicode, Union, default, observe, val
 
 # AiiDA imports.
 from aiida.cmdline.utils.ascii_vis import format_call_graph
-from aiida.cmdline.utils.query.calculation import CalculationQueryBuilder
-from aiida.engine import submit, Process, ProcessBuilder
+from aiida.cmdline.utils.query.formatting import format_relative_time, format_state
+from aiida.engine import submit, Process, ProcessBuilder, ProcessState
 from aiida.orm import (
     CalcFunctionNode,
     CalcJobNode,
+    Log,
     Node,
     ProcessNode,
+    QueryBuilder,
     WorkChainNode,
     WorkFunctionNode,
     load_node,
@@ -41,6 +45,8 @@ from aiida.common.exceptions import (
     NotExistent,
     NotExistentAttributeError,
 )
+from aiida.common import timezone
+from aiida.common.links import LinkType
 
 # Local imports.
 from .viewers import viewer
@@ -49,16 +55,47 @@ from .nodes import NodesTreeWidget
 
 def get_running_calcs(process):
     """Takes a process and yeilds running children calculations."""
+    processes = [process]
+    while processes:
+        process = processes.pop()
+        if process.is_sealed:
+            continue
+
+        # If a process is a running calculation - returning it
+        if isinstance(process, CalcJobNode):
+            yield process
+
+        # If the process is a running work chain - going through its children (keeping their order)
+        elif isinstance(process, WorkChainNode):
+            processes.extend(
+                reversed(
+                    [
+                        out_link.node
+                        for out_link in process.get_outgoing()
+                        if isinstance(out_link.node, ProcessNode)
+                    ]
+                )
+            )
+
+
+def _last_log_id():
+    """Return the id of the most recent log entry in the database."""
+    query = QueryBuilder().append(Log, project=["id"])
+    result = query.order_by({Log: {"id": "desc"}}).limit(1).first()
+    return result[0] if result else None
+
 
-    # If a process is a running calculation - returning it
-    if issubclass(type(process), CalcJobNode) and not process.is_sealed:
-        yield process
+@lru_cache(maxsize=32)
+def _workchain_report(
+    pk, levelname, indent_size, max_depth, last_log_id
+):  # pylint: disable=unused-argument
+    """Return the report of a work chain formatted as HTML.
 
-    # If the process is a running work chain - returning its children
-    elif issubclass(type(process), WorkChainNode) and not process.is_sealed:
-        for out_link in process.get_outgoing():
-            if isinstance(out_link.node, ProcessNode) and not out_link.node.is_sealed:
-                yield from get_running_calcs(out_link.node)
+    The report consists only of log entries, so it can't change as long as no new entry is
+    added to the database. The `last_log_id` argument is there to invalidate the cache."""
+    return get_workchain_report(
+        load_node(pk), levelname, indent_size, max_depth
+    ).replace("\n", "<br/>")
 
 
 class SubmitButtonWidget(ipw.VBox):
@@ -190,13 +227,20 @@ class ProcessInputsWidget(ipw.VBox):
         self.process = process
         self.output = ipw.Output()
         self.info = ipw.HTML()
-        inputs_list = (
-            [(input_.title(), input_) for input_ in self.process.inputs]
+        # Collect all the input nodes at once, instead of querying them one by one.
+        self._inputs = (
+            {
+                link.link_label: link.node
+                for link in self.process.get_incoming(
+                    link_type=(LinkType.INPUT_CALC, LinkType.INPUT_WORK)
+                ).all()
+            }
             if self.process
-            else []
+            else {}
         )
         inputs = ipw.Dropdown(
-            options=[("Select input", "")] + inputs_list,
+            options=[("Select input", "")]
+            + [(input_.title(), input_) for input_ in self._inputs],
             description="Select input:",
             style={"description_width": "initial"},
             disabled=False,
@@ -212,7 +256,7 @@ class ProcessInputsWidget(ipw.VBox):
             self.info.value = ""
             clear_output()
             if change["new"]:
-                selected_input = self.process.inputs[change["new"]]
+                selected_input = self._inputs[change["new"]]
                 self.info.value = "PK: {}".format(selected_input.id)
                 display(viewer(selected_input))
 
@@ -226,13 +270,20 @@ class ProcessOutputsWidget(ipw.VBox):
         self.process = process
         self.output = ipw.Output()
         self.info = ipw.HTML()
-        outputs_list = (
-            [(output.title(), output) for output in self.process.outputs]
+        # Collect all the output nodes at once, instead of querying them one by one.
+        self._outputs = (
+            {
+                link.link_label: link.node
+                for link in self.process.get_outgoing(
+                    link_type=(LinkType.CREATE, LinkType.RETURN)
+                ).all()
+            }
             if self.process
-            else []
+            else {}
         )
         outputs = ipw.Dropdown(
-            options=[("Select output", "")] + outputs_list,
+            options=[("Select output", "")]
+            + [(output.title(), output) for output in self._outputs],
             label="Select output",
             description="Select outputs:",
             style={"description_width": "initial"},
@@ -249,7 +300,7 @@ class ProcessOutputsWidget(ipw.VBox):
             self.info.value = ""
             clear_output()
             if change["new"]:
-                selected_output = self.process.outputs[change["new"]]
+                selected_output = self._outputs[change["new"]]
                 self.info.value = "PK: {}".format(selected_output.id)
                 display(viewer(selected_output))
 
@@ -265,14 +316,19 @@ class ProcessFollowerWidget(ipw.VBox):
         followers=None,
         update_interval=0.1,
         path_to_root="../",
+        max_update_interval=2.0,
         **kwargs,
     ):
-        """Initiate all the followers."""
+        """Initiate all the followers.
+
+        While the process doesn't change, the time between the updates grows from
+        `update_interval` up to `max_update_interval`."""
         self._monitor = None
 
         self.process = process
         self._run_after_completed = []
         self.update_interval = update_interval
+        self.max_update_interval = max_update_interval
         self.followers = []
         if followers is not None:
             for follower in followers:
@@ -302,12 +358,17 @@ class ProcessFollowerWidget(ipw.VBox):
             return
         self.output.value = ""
 
+        # Unlike ProcessListWidget, the follower keeps polling in the ProcessMonitor
+        # thread instead of an asyncio task: with detach=False this call has to block
+        # until the process is sealed, which a task on the kernel's own event loop
+        # could never do. Setting `process` to None stops the monitor thread.
         if self._monitor is None:
             self._monitor = ProcessMonitor(
                 process=self.process,
                 callbacks=[self.update],
                 on_sealed=self._run_after_completed,
                 timeout=self.update_interval,
+                max_timeout=self.max_update_interval,
             )
             ipw.dlink((self, "process"), (self._monitor, "process"))
 
@@ -344,9 +405,14 @@ class ProcessReportWidget(ipw.HTML):
         if isinstance(self.process, CalcJobNode):
             string = get_calcjob_report(self.process)
         elif isinstance(self.process, WorkChainNode):
-            string = get_workchain_report(
-                self.process, self.levelname, self.indent_size, self.max_depth
+            self.value = _workchain_report(
+                self.process.pk,
+                self.levelname,
+                self.indent_size,
+                self.max_depth,
+                _last_log_id(),
             )
+            return
         elif isinstance(self.process, (CalcFunctionNode, WorkFunctionNode)):
             string = get_process_function_report(self.process)
         else:
@@ -402,18 +468,20 @@ class ProgressBarWidget(ipw.VBox):
 
     process = Instance(ProcessNode, allow_none=True)
 
+    # Progress bar value and style corresponding to each process state.
+    PROGRESS = {
+        ProcessState.CREATED: (0, "info"),
+        ProcessState.RUNNING: (1, "info"),
+        ProcessState.WAITING: (1, "info"),
+        ProcessState.KILLED: (2, "danger"),
+        ProcessState.EXCEPTED: (2, "danger"),
+        ProcessState.FINISHED: (2, "success"),
+    }
+
     def __init__(self, title="Progress Bar", **kwargs):
         """Initialize ProgressBarWidget."""
 
         self.title = title
-        self.correspondance = {
-            "created": 0,
-            "running": 1,
-            "waiting": 1,
-            "killed": 2,
-            "excepted": 2,
-            "finished": 2,
-        }
         self.progress_bar = ipw.IntProgress(
             value=0,
             min=0,
@@ -435,14 +503,11 @@ class ProgressBarWidget(ipw.VBox):
         """Update the bar."""
         if self.process is None:
             return
-        self.progress_bar.value = self.correspondance[self.current_state]
-        if self.current_state == "finished":
-            self.progress_bar.bar_style = "success"
-        elif self.current_state in ["killed", "excepted"]:
-            self.progress_bar.bar_style = "danger"
-        else:
-            self.progress_bar.bar_style = "info"
-        self.state.value = self.current_state.capitalize()
+        process_state = self.process.process_state
+        self.progress_bar.value, self.progress_bar.bar_style = self.PROGRESS[
+            process_state
+        ]
+        self.state.value = process_state.value.capitalize()
 
     @property
     def current_state(self):
@@ -464,7 +529,7 @@ class CalcJobOutputWidget(ipw.Textarea):
             "style": {"description_width": "initial"},
         }
         default_params.update(kwargs)
-        self.output = []
+        self._position = 0  # Position in the output file up to which it was read.
 
         # Hack to make font monospace. As far as I am aware, currently there are no better ways.
         display(HTML("<style>textarea, input { font-family: monospace; }</style>"))
@@ -474,7 +539,7 @@ class CalcJobOutputWidget(ipw.Textarea):
     @observe("calculation")
     def _change_calculation(self, _=None):
         """Reset things if the observed calculation has changed."""
-        self.output = []
+        self._position = 0
         self.value = ""
 
     def update(self):
@@ -505,12 +570,15 @@ class CalcJobOutputWidget(ipw.Textarea):
             )
         else:
             if os.path.exists(output_file_path):
-                with open(output_file_path) as fobj:
-                    difference = fobj.readlines()[
-                        len(self.output) : -1
-                    ]  # Only adding the difference
-                    self.output += difference
-                    self.value += "".join(difference)
+                with open(output_file_path, "rb") as fobj:
+                    # Only read the part that was added since the last update.
+                    fobj.seek(self._position)
+                    difference = fobj.read()
+                # Keep the last line out until it is complete.
+                difference = difference[: difference.rfind(b"\n") + 1]
+                if difference:
+                    self._position += len(difference)
+                    self.value += difference.decode(errors="replace")
 
         # Auto scroll down. Doesn't work in detached mode.
         # Also a hack as it is applied to all the textareas
@@ -591,10 +659,13 @@ class ProcessListWidget(ipw.VBox):
     process_label = Unicode(allow_none=True)
     description_contains = Unicode(allow_none=True)
 
+    # Even without process state changes, refresh the list from time to time.
+    FALLBACK_UPDATE_INTERVAL = 60  # seconds
+
     def __init__(self, path_to_root="../", **kwargs):
         self.path_to_root = path_to_root
+        self._autoupdate = None
         self.table = ipw.HTML()
-        pd.set_option("max_colwidth", 40)
         self.output = ipw.HTML()
         update_button = ipw.Button(description="Update now")
         update_button.on_click(self.update)
@@ -605,8 +676,8 @@ class ProcessListWidget(ipw.VBox):
 
     def update(self, _=None):
         """Perform the query."""
-        # Here we are defining properties of 'df' class (specified while exporting pandas table into html).
-        # Since the exported object is nothing more than HTML table, all 'standard' HTML table settings
+        # Here we are defining properties of 'df' class (specified in the table header below).
+        # Since the table is nothing more than HTML table, all 'standard' HTML table settings
         # can be applied to it as well.
         # For more information on how to controle the table appearance please visit:
         # https://css-tricks.com/complete-guide-table-element/
@@ -620,53 +691,106 @@ class ProcessListWidget(ipw.VBox):
             .df th { text-align: center; border: none;  border-bottom: 1px solid black;}
         </style>
         """
-        builder = CalculationQueryBuilder()
-        filters = builder.get_filters(
-            all_entries=False,
-            process_state=self.process_states,
-            process_label=self.process_label,
-            exit_status=None,
-            failed=None,
-        )
-        relationships = {}
-        if self.incoming_node:
-            relationships = {**relationships, **{"with_outgoing": self.incoming_node}}
-
-        if self.outgoing_node:
-            relationships = {**relationships, **{"with_incoming": self.outgoing_node}}
-
-        query_set = builder.get_query_set(
+        filters = {}
+        if self.process_states:
+            filters["attributes.process_state"] = {"in": self.process_states}
+        if self.process_label:
+            if "%" in self.process_label or "_" in self.process_label:
+                filters["attributes.process_label"] = {"like": self.process_label}
+            else:
+                filters["attributes.process_label"] = self.process_label
+        if self.past_days >= 0:
+            filters["ctime"] = {">": timezone.now() - timedelta(days=self.past_days)}
+
+        # Project only the columns that are shown, all in a single query.
+        builder = QueryBuilder()
+        builder.append(
+            ProcessNode,
             filters=filters,
-            past_days=None if self.past_days < 0 else self.past_days,
-            order_by={"ctime": "desc"},
-            relationships=relationships,
-        )
-        projected = builder.get_projected(
-            query_set,
-            projections=[
-                "pk",
+            project=[
+                "id",
                 "ctime",
-                "process_label",
-                "state",
-                "process_status",
+                "attributes.process_label",
+                "attributes.process_state",
+                "attributes.paused",
+                "attributes.exit_status",
+                "attributes.process_status",
                 "description",
             ],
+            tag="process",
         )
-        dataf = pd.DataFrame(projected[1:], columns=projected[0])
+        if self.incoming_node:
+            builder.append(
+                type(self.incoming_node),
+                filters={"id": self.incoming_node.id},
+                with_outgoing="process",
+            )
+        if self.outgoing_node:
+            builder.append(
+                type(self.outgoing_node),
+                filters={"id": self.outgoing_node.id},
+                with_incoming="process",
+            )
+        builder.order_by({"process": {"ctime": "desc"}})
+
+        header = [
+            "PK",
+            "Created",
+            "Process label",
+            "Process State",
+            "Process status",
+            "Description",
+        ]
+
+        def format_row(  # pylint: disable=too-many-arguments
+            pk, ctime, label, state, paused, exit_status, status, description
+        ):
+            return [
+                pk,
+                format_relative_time(ctime),
+                label,
+                format_state(state, paused, exit_status),
+                status,
+                description,
+            ]
+
+        rows = [format_row(*row) for row in builder.iterall()]
 
         # Keep only process that contain the requested string in the description.
         if self.description_contains:
-            dataf = dataf[dataf.Description.str.contains(self.description_contains)]
+            description = header.index("Description")
+            rows = [
+                row
+                for row in rows
+                if re.search(self.description_contains, str(row[description]))
+            ]
+
+        self.output.value = "{} processes shown".format(len(rows))
 
-        self.output.value = "{} processes shown".format(len(dataf))
+        def cell(value):
+            """Shorten long values, to keep the table readable."""
+            value = str(value)
+            return value if len(value) <= 40 else value[:37] + "..."
 
         # Add HTML links.
-        dataf["PK"] = dataf["PK"].apply(
-            lambda x: """<a href={0}aiidalab-widgets-base/process.ipynb?id={1} target="_blank">{1}</a>""".format(
-                self.path_to_root, x
-            )
+        link = """<a href={0}aiidalab-widgets-base/process.ipynb?id={{0}} target="_blank">{{0}}</a>""".format(
+            self.path_to_root
+        )
+        self.table.value += "".join(
+            [
+                '<table class="df"><thead><tr>',
+                "".join(f"<th>{title}</th>" for title in header),
+                "</tr></thead><tbody>",
+                "".join(
+                    "<tr><td>{}</td>{}</tr>".format(
+                        link.format(row[0]),
+                        "".join(f"<td>{cell(value)}</td>" for value in row[1:]),
+                    )
+                    for row in rows
+                ),
+                "</tbody></table>",
+            ]
         )
-        self.table.value += dataf.to_html(classes="df", escape=False, index=False)
 
     @validate("incoming_node")
     def _validate_incoming_node(self, provided):
@@ -698,16 +822,62 @@ class ProcessListWidget(ipw.VBox):
             return provided["value"]
         return None
 
-    def _follow(self, update_interval):
-        while True:
-            self.update()
-            sleep(update_interval)
+    @staticmethod
+    def _subscribe_to_state_changes(callback):
+        """Call `callback` each time a process broadcasts a change of its state.
+
+        Returns a function that cancels the subscription, or None if the broadcasts
+        can't be received (e.g. the communicator isn't available)."""
+        from kiwipy import BroadcastFilter
+        from aiida.manage.manager import get_manager
+
+        def on_state_changed(*args, **kwargs):  # pylint: disable=unused-argument
+            callback()
+
+        try:
+            communicator = get_manager().get_communicator()
+            identifier = communicator.add_broadcast_subscriber(
+                BroadcastFilter(on_state_changed, subject="state_changed.*")
+            )
+        except Exception:  # pylint: disable=broad-except
+            return None
+        return lambda: communicator.remove_broadcast_subscriber(identifier)
+
+    async def _follow(self, update_interval):
+        loop = asyncio.get_event_loop()
+        state_changed = asyncio.Event()
+
+        # The broadcasts are received in the communicator's thread.
+        unsubscribe = self._subscribe_to_state_changes(
+            lambda: loop.call_soon_threadsafe(state_changed.set)
+        )
+        try:
+            while True:
+                # Query the database without blocking the kernel's event loop.
+                await loop.run_in_executor(None, self.update)
+                await asyncio.sleep(update_interval)
+                if unsubscribe is not None:
+                    # Only query the database again once some process has changed its state.
+                    try:
+                        await asyncio.wait_for(
+                            state_changed.wait(), self.FALLBACK_UPDATE_INTERVAL
+                        )
+                    except asyncio.TimeoutError:
+                        pass
+                    state_changed.clear()
+        finally:
+            if unsubscribe is not None:
+                unsubscribe()
 
     def start_autoupdate(self, update_interval=10):
-        import threading
+        """Keep updating the list in the background, until `stop_autoupdate` is called."""
+        self.stop_autoupdate()
+        self._autoupdate = asyncio.ensure_future(self._follow(update_interval))
 
-        update_state = threading.Thread(target=self._follow, args=(update_interval,))
-        update_state.start()
+    def stop_autoupdate(self):
+        if self._autoupdate is not None:
+            self._autoupdate.cancel()
+            self._autoupdate = None
 
 
 class ProcessMonitor(traitlets.HasTraits):
@@ -715,10 +885,18 @@ class ProcessMonitor(traitlets.HasTraits):
 
     process = traitlets.Instance(ProcessNode, allow_none=True)
 
-    def __init__(self, callbacks=None, on_sealed=None, timeout=None, **kwargs):
+    def __init__(  # pylint: disable=too-many-arguments
+        self, callbacks=None, on_sealed=None, timeout=None, max_timeout=None, **kwargs
+    ):
         self.callbacks = [] if callbacks is None else list(callbacks)
         self.on_sealed = [] if on_sealed is None else list(on_sealed)
         self.timeout = 0.1 if timeout is None else timeout
+        # Opt-in back-off: while the process node doesn't change, the time between the
+        # updates grows from `timeout` up to `max_timeout`. Note that only the process
+        # itself is checked, not its children, outputs or logs.
+        self.max_timeout = (
+            self.timeout if max_timeout is None else max(self.timeout, max_timeout)
+        )
 
         self._monitor_thread = None
         self._monitor_thread_stop = Event()
@@ -769,10 +947,31 @@ class ProcessMonitor(traitlets.HasTraits):
                     )
                     disabled_funcs.add(func)
 
+        def _state():
+            return (
+                process.process_state,
+                process.process_status,
+                process.exit_status,
+                process.mtime,
+            )
+
+        timeout = self.timeout
+        last_state = None
         while not process.is_sealed:
             _run(self.callbacks)
 
-            if self._monitor_thread_stop.wait(timeout=self.timeout):
+            # Back off as long as the process stays the same, get back to the
+            # initial update rate as soon as it changes. The state is only read
+            # from the database if the back-off is enabled.
+            if self.max_timeout > self.timeout:
+                state = _state()
+                if state == last_state:
+                    timeout = min(timeout * 1.5, self.max_timeout)
+                else:
+                    timeout = self.timeout
+                    last_state = state
+
+            if self._monitor_thread_stop.wait(timeout=timeout):
                 break  # thread was signaled to be stopped
 
         # Final update:
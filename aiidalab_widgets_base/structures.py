@@ -3,7 +3,8 @@
 
 import io
 import datetime
-from collections import OrderedDict
+from functools import lru_cache
+from time import time
 import numpy as np
 import ipywidgets as ipw
 from traitlets import Instance, Int, List, Unicode, Union, dlink, link, default, observe
@@ -12,7 +13,7 @@ from sklearn.decomposition import PCA
 # ASE imports
 import ase
 from ase import Atom, Atoms
-from ase.data import chemical_symbols, covalent_radii
+from ase.data import atomic_masses, atomic_numbers, chemical_symbols, covalent_radii
 
 # AiiDA imports
 from aiida.engine import calcfunction
@@ -23,6 +24,7 @@ from aiida.orm import (
     QueryBuilder,
     Node,
     WorkChainNode,
+    load_node,
 )
 from aiida.plugins import DataFactory
 
@@ -60,7 +62,7 @@ class StructureManagerWidget(ipw.VBox):
         editors=None,
         storable=True,
         node_class=None,
-        **kwargs
+        **kwargs,
     ):
         """
         Arguments:
@@ -384,13 +386,14 @@ class StructureUploadWidget(ipw.VBox):
     def _on_file_upload(self, change=None):
         """When file upload button is pressed."""
         for fname, item in change["new"].items():
-            frmt = fname.split(".")[-1]
+            frmt = fname.rsplit(".", 1)[-1]
             if frmt == "cif":
                 self.structure = CifData(file=io.BytesIO(item["content"]))
             else:
                 self.structure = self._validate_and_fix_ase_cell(
                     get_ase_from_file(
-                        io.StringIO(item["content"].decode()), format=frmt
+                        io.TextIOWrapper(io.BytesIO(item["content"]), encoding="utf-8"),
+                        format=frmt,
                     )
                 )
             self.file_upload.value.clear()
@@ -426,11 +429,17 @@ class StructureExamplesWidget(ipw.VBox):
         """When structure is selected."""
 
         self.structure = (
-            get_ase_from_file(self._select_structure.value)
+            self._read_example(self._select_structure.value).copy()
             if self._select_structure.value
             else None
         )
 
+    @staticmethod
+    @lru_cache(maxsize=16)
+    def _read_example(fname):
+        """Read an example structure, users often switch back and forth between the same few."""
+        return get_ase_from_file(fname)
+
     @default("structure")
     def _default_structure(self):
         return None
@@ -441,16 +450,18 @@ class StructureBrowserWidget(ipw.VBox):
 
     structure = Union([Instance(Atoms), Instance(Data)], allow_none=True)
 
+    # Process labels found in the database are shared between all the instances for this long.
+    PROCESS_LABELS_CACHE_TIMEOUT = 300  # seconds
+    _process_labels_cache = (None, [])  # (time of the query, labels)
+
     def __init__(self, title=""):
         self.title = title
 
         # Structure objects we want to query for.
         self.query_structure_type = (DataFactory("structure"), DataFactory("cif"))
 
-        # Extracting available process labels.
-        qbuilder = QueryBuilder().append((CalcJobNode, WorkChainNode), project="label")
         self.drop_label = ipw.Dropdown(
-            options=sorted({"All"}.union({i[0] for i in qbuilder.iterall() if i[0]})),
+            options=sorted({"All"}.union(self._process_labels())),
             value="All",
             description="Process Label",
             disabled=True,
@@ -503,20 +514,39 @@ class StructureBrowserWidget(ipw.VBox):
         self.search()
         super().__init__([box, h_line, self.results])
 
+    @classmethod
+    def _process_labels(cls):
+        """Extracting available process labels."""
+        timestamp, labels = cls._process_labels_cache
+        if timestamp is None or time() - timestamp > cls.PROCESS_LABELS_CACHE_TIMEOUT:
+            qbuilder = QueryBuilder().append(
+                (CalcJobNode, WorkChainNode), project="label"
+            )
+            labels = [label for label, in qbuilder.distinct().iterall() if label]
+            cls._process_labels_cache = (time(), labels)
+        return labels
+
     def preprocess(self):
         """Search structures in AiiDA database and add formula extra to them."""
+        from aiida.manage.manager import get_manager
 
         queryb = QueryBuilder()
         queryb.append(
             self.query_structure_type, filters={"extras": {"!has_key": "formula"}}
         )
-        for item in queryb.all():  # iterall() would interfere with set_extra()
-            try:
-                formula = item[0].get_formula()
-            except AttributeError:
-                # Slow part.
-                formula = item[0].get_ase().get_chemical_formula()
-            item[0].set_extra("formula", formula)
+        items = queryb.all()  # iterall() would interfere with set_extra()
+        if not items:
+            return
+
+        # Store all the extras in a single database transaction.
+        with get_manager().get_backend().transaction():
+            for item in items:
+                try:
+                    formula = item[0].get_formula()
+                except AttributeError:
+                    # Slow part.
+                    formula = item[0].get_ase().get_chemical_formula()
+                item[0].set_extra("formula", formula)
 
     def search(self, _=None):
         """Launch the search of structures in AiiDA database."""
@@ -553,7 +583,7 @@ class StructureBrowserWidget(ipw.VBox):
             processed_nodes = [n[0] for n in qbuild2.all()]
             if processed_nodes:
                 filters["id"] = {"!in": processed_nodes}
-            qbuild.append(self.query_structure_type, filters=filters)
+            qbuild.append(self.query_structure_type, filters=filters, tag="structures")
 
         elif self.mode.value == "calculated":
             if self.drop_label.value == "All":
@@ -568,6 +598,7 @@ class StructureBrowserWidget(ipw.VBox):
                 self.query_structure_type,
                 with_incoming="calcjobworkchain",
                 filters=filters,
+                tag="structures",
             )
 
         elif self.mode.value == "edited":
@@ -576,31 +607,36 @@ class StructureBrowserWidget(ipw.VBox):
                 self.query_structure_type,
                 with_incoming=CalcFunctionNode,
                 filters=filters,
+                tag="structures",
             )
 
         elif self.mode.value == "all":
-            qbuild.append(self.query_structure_type, filters=filters)
-
-        qbuild.order_by({self.query_structure_type: {"ctime": "desc"}})
-        matches = {n[0] for n in qbuild.iterall()}
-        matches = sorted(matches, reverse=True, key=lambda n: n.ctime)
-
-        options = OrderedDict()
-        options["Select a Structure ({} found)".format(len(matches))] = False
+            qbuild.append(self.query_structure_type, filters=filters, tag="structures")
 
-        for mch in matches:
-            label = "PK: {}".format(mch.id)
-            label += " | " + mch.ctime.strftime("%Y-%m-%d %H:%M")
-            label += " | " + mch.get_extra("formula")
-            label += " | " + mch.node_type.split(".")[-2]
-            label += " | " + mch.label
-            label += " | " + mch.description
-            options[label] = mch
+        # Only project what is shown, the node itself is loaded once it is selected.
+        qbuild.add_projection(
+            "structures",
+            ["id", "ctime", "extras.formula", "node_type", "label", "description"],
+        )
+        qbuild.order_by({"structures": {"ctime": "desc"}})
+        matches = qbuild.distinct().all()
+
+        options = [("Select a Structure ({} found)".format(len(matches)), False)]
+        for pk, ctime, formula, node_type, label, description in matches:
+            # Same as strftime("%Y-%m-%d %H:%M"), without parsing the format each time.
+            ctime = ctime.isoformat(" ", "minutes")[:16]
+            options.append(
+                (
+                    f"PK: {pk} | {ctime} | {formula} | "
+                    f"{node_type.split('.')[-2]} | {label} | {description}",
+                    pk,
+                )
+            )
 
         self.results.options = options
 
     def _on_select_structure(self, _=None):
-        self.structure = self.results.value or None
+        self.structure = load_node(self.results.value) if self.results.value else None
 
 
 class SmilesWidget(ipw.VBox):
@@ -676,13 +712,22 @@ class SmilesWidget(ipw.VBox):
         pbmol.localopt(forcefield="gaff", steps=200)
         pbmol.localopt(forcefield="mmff94", steps=100)
 
+        # Conjugate gradients need about as many steps as there are degrees of freedom
+        # to converge, so small molecules don't need the full number of steps.
+        steps = min(steps, max(500, 50 * pbmol.OBMol.NumAtoms()))
+
         f_f = pb._forcefields["uff"]  # pylint: disable=protected-access
         f_f.Setup(pbmol.OBMol)
         f_f.ConjugateGradients(steps, 1.0e-9)
         f_f.GetCoordinates(pbmol.OBMol)
-        species = [chemical_symbols[atm.atomicnum] for atm in pbmol.atoms]
-        positions = np.asarray([atm.coords for atm in pbmol.atoms])
-        return self.make_ase(species, positions)
+
+        # Every access to `pbmol.atoms` wraps all the atoms anew, so do it only once.
+        atoms = pbmol.atoms
+        numbers = np.fromiter(
+            (atm.atomicnum for atm in atoms), dtype=np.intp, count=len(atoms)
+        )
+        positions = np.array([atm.coords for atm in atoms], dtype=float)
+        return self.make_ase(numbers, positions)
 
     def _rdkit_opt(self, smile, steps):
         """Optimize a molecule using force field and rdkit (needed for complex SMILES)."""
@@ -734,6 +779,8 @@ class BasicStructureEditor(ipw.VBox):  # pylint: disable=too-many-instance-attri
     def __init__(self, title=""):
 
         self.title = title
+        self._sel_idx = np.array([], dtype=np.intp)  # Selection as an index array.
+
         # Define action vector.
         self.axis_p1 = ipw.Text(
             description="Starting point", value="0 0 0", layout={"width": "initial"}
@@ -957,6 +1004,29 @@ class BasicStructureEditor(ipw.VBox):  # pylint: disable=too-many-instance-attri
             ]
         )
 
+    @observe("selection")
+    def _observe_selection(self, _=None):
+        self._sel_idx = np.array(self.selection, dtype=np.intp)
+
+    def _mutate(self, positions=None, numbers=None):
+        """Return a copy of the structure with new positions and/or atomic numbers.
+
+        Unlike Atoms.copy(), the arrays that are replaced are not copied first."""
+        atoms = Atoms(
+            cell=self.structure.cell,
+            pbc=self.structure.pbc,
+            info=self.structure.info,
+            celldisp=self.structure.get_celldisp(),
+        )
+        replaced = {"positions": positions, "numbers": numbers}
+        for name, array in self.structure.arrays.items():
+            new = replaced.get(name)
+            atoms.arrays[name] = array.copy() if new is None else new
+        atoms.constraints = [
+            constraint.copy() for constraint in self.structure.constraints
+        ]
+        return atoms
+
     def str2vec(self, string):
         return np.array(list(map(float, string.split())))
 
@@ -972,7 +1042,7 @@ class BasicStructureEditor(ipw.VBox):  # pylint: disable=too-many-instance-attri
     def sel2com(self):
         """Get center of mass of the selection."""
         if self.selection:
-            com = np.average(self.structure[self.selection].get_positions(), axis=0)
+            com = np.average(self.structure.positions[self._sel_idx], axis=0)
         else:
             com = [0, 0, 0]
 
@@ -999,7 +1069,7 @@ class BasicStructureEditor(ipw.VBox):  # pylint: disable=too-many-instance-attri
     def def_axis_p2(self, _=None):
         """Define the second point of axis."""
         com = (
-            np.average(self.structure[self.selection].get_positions(), axis=0)
+            np.average(self.structure.positions[self._sel_idx], axis=0)
             if self.selection
             else [0, 0, 1]
         )
@@ -1019,61 +1089,66 @@ class BasicStructureEditor(ipw.VBox):  # pylint: disable=too-many-instance-attri
 
     def translate_dr(self, _=None):
         """Translate by dr along the selected vector."""
-        atoms = self.structure.copy()
-
         selection = self.selection
+        positions = self.structure.positions.copy()
 
-        atoms.positions[self.selection] += np.array(
-            self.action_vector * self.displacement.value
-        )
+        positions[self._sel_idx] += self.action_vector * self.displacement.value
 
-        self.structure = atoms
+        self.structure = self._mutate(positions=positions)
         self.selection = selection
 
     def translate_dxdydz(self, _=None):
         """Translate by the selected XYZ delta."""
         selection = self.selection
-        atoms = self.structure.copy()
+        positions = self.structure.positions.copy()
 
         # The action.
-        atoms.positions[self.selection] += np.array(self.str2vec(self.dxyz.value))
+        positions[self._sel_idx] += self.str2vec(self.dxyz.value)
 
-        self.structure = atoms
+        self.structure = self._mutate(positions=positions)
         self.selection = selection
 
     def translate_to_xyz(self, _=None):
         """Translate to the selected XYZ position."""
         selection = self.selection
-        atoms = self.structure.copy()
+        positions = self.structure.positions.copy()
 
         # The action.
-        geo_center = np.average(self.structure[self.selection].get_positions(), axis=0)
-        atoms.positions[self.selection] += self.str2vec(self.dxyz.value) - geo_center
+        geo_center = np.average(positions[self._sel_idx], axis=0)
+        positions[self._sel_idx] += self.str2vec(self.dxyz.value) - geo_center
 
-        self.structure = atoms
+        self.structure = self._mutate(positions=positions)
         self.selection = selection
 
     def rotate(self, _=None):
         """Rotate atoms around selected point in space and vector."""
 
         selection = self.selection
-        atoms = self.structure.copy()
+        positions = self.structure.positions.copy()
 
         # The action.
-        rotated_subset = atoms[self.selection]
         vec = self.str2vec(self.vec2str(self.action_vector))
+        vec = vec / np.linalg.norm(vec)
         center = self.str2vec(self.point.value)
-        rotated_subset.rotate(self.phi.value, v=vec, center=center, rotate_cell=False)
-        atoms.positions[list(self.selection)] = rotated_subset.positions
 
-        self.structure = atoms
+        # Rotation matrix (Rodrigues' formula), same convention as Atoms.rotate().
+        phi = np.deg2rad(self.phi.value)
+        cross = np.array(
+            [[0, -vec[2], vec[1]], [vec[2], 0, -vec[0]], [-vec[1], vec[0], 0]]
+        )
+        rotation = np.eye(3) + np.sin(phi) * cross + (1 - np.cos(phi)) * cross @ cross
+        positions[self._sel_idx] = (
+            positions[self._sel_idx] - center
+        ) @ rotation.T + center
+
+        self.structure = self._mutate(positions=positions)
         self.selection = selection
 
     def mirror(self, _=None, norm=None, point=None):
         """Mirror atoms on the plane perpendicular to the action vector."""
 
         selection = self.selection
-        atoms = self.structure.copy()
+        positions = self.structure.positions.copy()
 
         # The action.
 
@@ -1086,7 +1161,7 @@ class BasicStructureEditor(ipw.VBox):  # pylint: disable=too-many-instance-attri
             return
 
         # Define vectors from p_point that point to the atoms which are to be moved.
-        mirror_subset = atoms.positions[selection] - p_point
+        mirror_subset = positions[self._sel_idx] - p_point
 
         # Project vectors onto the plane normal.
         projections = (
@@ -1096,9 +1171,9 @@ class BasicStructureEditor(ipw.VBox):  # pylint: disable=too-many-instance-attri
         )
 
         # Mirror atoms.
-        atoms.positions[selection] -= 2 * projections
+        positions[self._sel_idx] -= 2 * projections
 
-        self.structure = atoms
+        self.structure = self._mutate(positions=positions)
         self.selection = selection
 
     def mirror_3p(self, _=None):
@@ -1113,36 +1188,44 @@ class BasicStructureEditor(ipw.VBox):  # pylint: disable=too-many-instance-attri
     def align(self, _=None):
         """Rotate atoms to align action vector with XYZ vector."""
 
-        atoms = self.structure.copy()
         selection = self.selection
 
         if not self.selection:
             return
 
         # The action.
+        positions = self.structure.positions.copy()
         center = self.str2vec(self.point.value)
-        subset = atoms[selection]
+        subset = self.structure[self._sel_idx]
         subset.rotate(self.action_vector, self.str2vec(self.dxyz.value), center=center)
-        atoms.positions[selection] = subset.positions
+        positions[self._sel_idx] = subset.positions
 
-        self.structure = atoms
+        self.structure = self._mutate(positions=positions)
         self.selection = selection
 
     def mod_element(self, _=None):
         """Modify selected atoms into the given element."""
-        atoms = self.structure.copy()
         selection = self.selection
 
         if self.ligand.value == 0:
-            for idx in self.selection:
-                new = Atom(self.element.value)
-                atoms[idx].mass = new.mass
-                atoms[idx].magmom = new.magmom
-                atoms[idx].momentum = new.momentum
-                atoms[idx].symbol = new.symbol
-                atoms[idx].tag = new.tag
-                atoms[idx].charge = new.charge
+            number = atomic_numbers[self.element.value]
+            numbers = self.structure.numbers.copy()
+            numbers[self._sel_idx] = number
+            atoms = self._mutate(numbers=numbers)
+
+            # Reset the properties of the modified atoms to the defaults of the new element.
+            # Missing arrays already default to the right values.
+            for name, value in [
+                ("masses", atomic_masses[number]),
+                ("initial_magmoms", 0.0),
+                ("momenta", 0.0),
+                ("tags", 0),
+                ("initial_charges", 0.0),
+            ]:
+                if atoms.has(name):
+                    atoms.arrays[name][self._sel_idx] = value
         else:
+            atoms = self.structure.copy()
             initial_ligand = self.ligand.rotate(
                 align_to=self.action_vector, remove_anchor=True
             )
@@ -1162,7 +1245,7 @@ class BasicStructureEditor(ipw.VBox):  # pylint: disable=too-many-instance-attri
         selection = self.selection
 
         # The action
-        add_atoms = atoms[self.selection].copy()
+        add_atoms = self.structure[self._sel_idx]
         add_atoms.translate([1.0, 0, 0])
         atoms += add_atoms
 
@@ -1181,17 +1264,16 @@ class BasicStructureEditor(ipw.VBox):  # pylint: disable=too-many-instance-attri
             initial_ligand = self.ligand.rotate(align_to=self.action_vector)
             rad = SYMBOL_RADIUS[self.ligand.anchoring_atom]
 
-        for idx in self.selection:
+        # Covalent radii of all the selected atoms at once.
+        radii = covalent_radii[self.structure.numbers[self._sel_idx]]
+
+        for idx, radius in zip(self.selection, radii):
             # It is important to copy, otherwise the initial structure will be modified
             position = self.structure.positions[idx].copy()
             lgnd = initial_ligand.copy()
 
             if self.bond_length.disabled:
-                lgnd.translate(
-                    position
-                    + self.action_vector
-                    * (SYMBOL_RADIUS[self.structure.symbols[idx]] + rad)
-                )
+                lgnd.translate(position + self.action_vector * (radius + rad))
             else:
                 lgnd.translate(position + self.action_vector * self.bond_length.value)
 
@@ -1202,6 +1284,6 @@ class BasicStructureEditor(ipw.VBox):  # pylint: disable=too-many-instance-attri
 
     def remove(self, _):
         """Remove selected atoms."""
-        atoms = self.structure.copy()
-        del [atoms[self.selection]]
-        self.structure = atoms
+        keep = np.ones(len(self.structure), dtype=bool)
+        keep[self._sel_idx] = False
+        self.structure = self.structure[keep]
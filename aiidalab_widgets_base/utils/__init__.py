@@ -1,6 +1,9 @@
 """Some utility functions used acrross the repository."""
+from itertools import islice
+
 import more_itertools as mit
-from ase.io import read
+import numpy as np
+from ase.io import iread
 
 
 def valid_arguments(arguments, valid_args):
@@ -26,10 +29,11 @@ def predefine_settings(obj, **kwargs):
 
 def get_ase_from_file(fname, format=None):  # pylint: disable=redefined-builtin
     """Get ASE structure object."""
-    if format == "cif":
-        traj = read(fname, format=format, index=":", store_tags=True)
-    else:
-        traj = read(fname, format=format, index=":")
+    kwargs = {"store_tags": True} if format == "cif" else {}
+
+    # Parse at most two frames: the first one is returned, the second one only tells
+    # whether the file contains more than one structure.
+    traj = list(islice(iread(fname, format=format, index=":", **kwargs), 2))
     if not traj:
         print(("Could not read any information from the file {}".format(fname)))
         return False
@@ -58,12 +62,18 @@ def list_to_string_range(lst, shift=1):
     """Converts a list like [0, 2, 3, 4] into a string like '1 3..5'.
 
     Shift used when e.g. for a user interface numbering starts from 1 not from 0"""
+    values = np.sort(np.asarray(lst, dtype=int)) + shift
+    if values.size == 0:
+        return ""
+
+    # Runs of consecutive numbers end wherever the step to the next number is not 1.
+    breaks = np.flatnonzero(np.diff(values) != 1)
+    starts = np.concatenate(([values[0]], values[breaks + 1]))
+    ends = np.concatenate((values[breaks], [values[-1]]))
     return " ".join(
         [
-            f"{t[0] + shift}..{t[1] + shift}"
-            if isinstance(t, tuple)
-            else str(t + shift)
-            for t in find_ranges(sorted(lst))
+            str(start) if start == end else f"{start}..{end}"
+            for start, end in zip(starts.tolist(), ends.tolist())
         ]
     )
 
@@ -2,14 +2,17 @@
 # pylint: disable=no-self-use
 
 import base64
+import json
 import warnings
+from functools import lru_cache
 import numpy as np
 from numpy.linalg import norm
 import ipywidgets as ipw
 from IPython.display import display
-import nglview
 from ase import Atoms
 from ase import neighborlist
+from ase.data import covalent_radii
+from ase.geometry import cell_to_cellpar, cellpar_to_cell
 from vapory import (
     Camera,
     LightSource,
@@ -35,7 +38,7 @@ from traitlets import (
     observe,
     validate,
 )
-from aiida.orm import Node
+from aiida.orm import Node, load_node
 
 from .utils import string_range_to_list, list_to_string_range
 from .dicts import Colors, Radius
@@ -55,6 +58,32 @@ def register_viewer_widget(key):
     return registration_decorator
 
 
+def _download_text(text, filename, mime_type="text/plain"):
+    """Let the browser download a string as a file named as filename.
+
+    The text is embedded as a JSON string and turned into a Blob on the client side,
+    which avoids the base64 encoding (and its overhead) of a data URL."""
+    from IPython.display import Javascript
+
+    javas = Javascript(
+        """
+        var blob = new Blob([{text}], {{type: {mime_type}}});
+        var link = document.createElement('a');
+        link.href = URL.createObjectURL(blob);
+        link.download = {filename};
+        document.body.appendChild(link);
+        link.click();
+        document.body.removeChild(link);
+        setTimeout(function () {{ URL.revokeObjectURL(link.href); }}, 1000);
+        """.format(
+            text=json.dumps(text),
+            mime_type=json.dumps(mime_type),
+            filename=json.dumps(filename),
+        )
+    )
+    display(javas)
+
+
 def viewer(obj, downloadable=True, **kwargs):
     """Display AiiDA data types in Jupyter notebooks.
 
@@ -115,22 +144,37 @@ class DictViewer(ipw.VBox):
         """
 
         pd.set_option("max_colwidth", 40)
-        dataf = pd.DataFrame(
-            [(key, value) for key, value in sorted(parameter.get_dict().items())],
-            columns=["Key", "Value"],
-        )
-        self.value += dataf.to_html(
+        items = parameter.get_dict()
+        keys = sorted(items)
+        self._dataf = pd.DataFrame({"Key": keys, "Value": [items[k] for k in keys]})
+        self._filename = "{}.csv".format(parameter.pk)
+        self.value += self._dataf.to_html(
             classes="df", index=False
         )  # specify that exported table belongs to 'df' class
         # this is used to setup table's appearance using CSS
+        children = [self.widget]
         if downloadable:
-            payload = base64.b64encode(dataf.to_csv(index=False).encode()).decode()
-            fname = "{}.csv".format(parameter.pk)
-            to_add = """Download table in csv format: <a download="{filename}"
-            href="data:text/csv;base64,{payload}" target="_blank">{title}</a>"""
-            self.value += to_add.format(filename=fname, payload=payload, title=fname)
+            # The csv file is only generated when the user asks for it.
+            self.download_btn = ipw.Button(description="Download table (csv)")
+            self.download_btn.on_click(self.download)
+            children.append(self.download_btn)
+
+        super().__init__(children, **kwargs)
+
+    def download(self, change=None):  # pylint: disable=unused-argument
+        """Prepare the table in csv format for downloading."""
+        _download_text(
+            self._dataf.to_csv(index=False), self._filename, mime_type="text/csv"
+        )
 
-        super().__init__([self.widget], **kwargs)
+
+@lru_cache(maxsize=8)
+def _parse_selection(selection_string):
+    """Convert a selection string into atom indices, remembering recent strings.
+
+    The indices are returned as a tuple, so the cached result can't be modified."""
+    selection, syntax_ok = string_range_to_list(selection_string, shift=-1)
+    return tuple(selection), syntax_ok
 
 
 class _StructureDataBaseViewer(ipw.VBox):
@@ -145,14 +189,20 @@ class _StructureDataBaseViewer(ipw.VBox):
     DEFAULT_SELECTION_OPACITY = 0.2
     DEFAULT_SELECTION_RADIUS = 6
     DEFAULT_SELECTION_COLOR = "green"
+    # Formats whose ASE writers work with in-memory text or binary file objects.
+    TEXT_FILE_FORMATS = ("xyz", "extxyz")
+    BINARY_FILE_FORMATS = ("cif",)
 
     def __init__(self, configure_view=True, **kwargs):
         # Defining viewer box.
 
         # 1. Nglviwer
+        import nglview
+
         self._viewer = nglview.NGLWidget()
         self._viewer.camera = "orthographic"
         self._viewer.observe(self._on_atom_click, names="picked")
+        self._highlighted = False
         self._viewer.stage.set_parameters(mouse_preset="pymol")
 
         # 2. Camera type.
@@ -318,6 +368,16 @@ class _StructureDataBaseViewer(ipw.VBox):
 
         return ipw.VBox([self.download_box, self.screenshot_box, self.render_box])
 
+    @staticmethod
+    def _bonded_pairs(atoms):
+        """Return the pairs (i, j) with i < j of atoms that are bonded in the rendering."""
+        # Same criterion as ASE's NeighborList, which adds its default skin of 0.3 A
+        # to the natural cutoff (covalent radius) of each atom.
+        cutoffs = [cutoff + 0.3 for cutoff in neighborlist.natural_cutoffs(atoms)]
+        first, second = neighborlist.neighbor_list("ij", atoms, cutoffs)
+        mask = first < second
+        return list(zip(first[mask].tolist(), second[mask].tolist()))
+
     def _render_structure(self, change=None):
         """Render the structure with POVRAY."""
 
@@ -357,16 +417,7 @@ class _StructureDataBaseViewer(ipw.VBox):
 
         bonds = []
 
-        cutOff = neighborlist.natural_cutoffs(
-            bb
-        )  # Takes the cutoffs from the ASE database
-        neighborList = neighborlist.NeighborList(
-            cutOff, self_interaction=False, bothways=False
-        )
-        neighborList.update(bb)
-        matrix = neighborList.get_connectivity_matrix()
-
-        for k in matrix.keys():
+        for k in self._bonded_pairs(bb):
             i = bb[k[0]]
             j = bb[k[1]]
 
@@ -460,13 +511,12 @@ class _StructureDataBaseViewer(ipw.VBox):
         index = self._viewer.picked["atom1"]["index"]
         selection = self.selection.copy()
 
-        if selection:
-            if index not in selection:
-                selection.append(index)
-            else:
-                selection.remove(index)
+        # Keep the order in which the atoms were picked, the selection info (angles,
+        # dihedrals, ...) and the structure editor depend on it.
+        if index in selection:
+            selection.remove(index)
         else:
-            selection = [index]
+            selection.append(index)
 
         self.selection = selection
 
@@ -480,16 +530,21 @@ class _StructureDataBaseViewer(ipw.VBox):
         """Highlighting atoms according to the provided list."""
         if not hasattr(self._viewer, "component_0"):
             return
-        self._viewer._remove_representations_by_name(
-            repr_name="selected_atoms"
-        )  # pylint:disable=protected-access
-        self._viewer.add_ball_and_stick(  # pylint:disable=no-member
-            name="selected_atoms",
-            selection=list() if vis_list is None else vis_list,
-            color=color,
-            aspectRatio=size,
-            opacity=opacity,
-        )
+        # NGL can't change the atoms of an existing representation, so the highlight
+        # is replaced. Nothing is sent for an empty selection that is already empty.
+        if self._highlighted:
+            self._viewer._remove_representations_by_name(
+                repr_name="selected_atoms"
+            )  # pylint:disable=protected-access
+        self._highlighted = bool(vis_list)
+        if self._highlighted:
+            self._viewer.add_ball_and_stick(  # pylint:disable=no-member
+                name="selected_atoms",
+                selection=vis_list,
+                color=color,
+                aspectRatio=size,
+                opacity=opacity,
+            )
 
     @default("supercell")
     def _default_supercell(self):
@@ -511,13 +566,11 @@ class _StructureDataBaseViewer(ipw.VBox):
     def apply_selection(self, _=None):
         """Apply selection specified in the text field."""
         selection_string = self._selected_atoms.value
-        expanded_selection, syntax_ok = string_range_to_list(
-            self._selected_atoms.value, shift=-1
-        )
+        expanded_selection, syntax_ok = _parse_selection(self._selected_atoms.value)
         # self.wrong_syntax.layout.visibility = 'hidden' if syntax_ok else 'visible'
         if syntax_ok:
             self.wrong_syntax.layout.visibility = "hidden"
-            self.selection = expanded_selection
+            self.selection = list(expanded_selection)
             self._selected_atoms.value = (
                 selection_string  # Keep the old string for further editing.
             )
@@ -552,13 +605,28 @@ class _StructureDataBaseViewer(ipw.VBox):
 
     def _prepare_payload(self, file_format=None):
         """Prepare binary information."""
+        from io import BytesIO, StringIO
         from tempfile import NamedTemporaryFile
 
         file_format = file_format if file_format else self.file_format.value
-        tmp = NamedTemporaryFile()
-        self.structure.write(tmp.name, format=file_format)  # pylint: disable=no-member
-        with open(tmp.name, "rb") as raw:
-            return base64.b64encode(raw.read()).decode()
+
+        # Known formats are written in memory, the others need a file on disk.
+        if file_format in self.TEXT_FILE_FORMATS:
+            buf = StringIO()
+            self.structure.write(buf, format=file_format)  # pylint: disable=no-member
+            return base64.b64encode(buf.getvalue().encode()).decode()
+
+        if file_format in self.BINARY_FILE_FORMATS:
+            buf = BytesIO()
+            self.structure.write(buf, format=file_format)  # pylint: disable=no-member
+            return base64.b64encode(buf.getvalue()).decode()
+
+        with NamedTemporaryFile() as tmp:
+            self.structure.write(
+                tmp.name, format=file_format
+            )  # pylint: disable=no-member
+            with open(tmp.name, "rb") as raw:
+                return base64.b64encode(raw.read()).decode()
 
     @property
     def thumbnail(self):
@@ -582,6 +650,7 @@ class StructureDataViewer(_StructureDataBaseViewer):
 
     structure = Union([Instance(Atoms), Instance(Node)], allow_none=True)
     displayed_structure = Instance(Atoms, allow_none=True, read_only=True)
+    LARGE_STRUCTURE_NATOMS = 5000
 
     def __init__(self, structure=None, **kwargs):
         super().__init__(**kwargs)
@@ -619,21 +688,75 @@ class StructureDataViewer(_StructureDataBaseViewer):
         else:
             self.set_trait("displayed_structure", None)
 
+    @staticmethod
+    def _bonds(structure):
+        """Return the bonded pairs of atoms, encoded as sorted integers."""
+        # Bond criterion similar to the one NGL uses: sum of covalent radii + 0.3 A.
+        first, second = neighborlist.primitive_neighbor_list(
+            "ij",
+            [False, False, False],
+            structure.cell,
+            structure.positions,
+            covalent_radii[structure.numbers] + 0.15,
+        )
+        return np.sort(first * len(structure) + second)
+
+    @staticmethod
+    def _ngl_positions(structure):
+        """Return the atomic positions in the frame of the structure loaded into NGL.
+
+        nglview passes the structure to NGL through ASE's PDB writer, which rotates
+        periodic cells into the standard orientation given by their cell parameters."""
+        if not structure.pbc.any():
+            return structure.positions
+        cell = np.asarray(structure.cell)
+        rotation = np.linalg.solve(cell, cellpar_to_cell(cell_to_cellpar(cell)))
+        return structure.positions.dot(rotation)
+
+    def _only_positions_changed(self, old, new):
+        """Check whether the new structure differs from the old one only by atomic positions."""
+        if old is None or new is None or len(old) != len(new):
+            return False
+        if not (
+            np.array_equal(old.numbers, new.numbers)
+            and np.array_equal(old.pbc, new.pbc)
+            and np.allclose(old.cell, new.cell)
+        ):
+            return False
+        return np.array_equal(self._bonds(old), self._bonds(new))
+
     @observe("displayed_structure")
     def _update_structure_viewer(self, change):
         """Update the view if displayed_structure trait was modified."""
+        import nglview
+
+        # If the atoms and bonds stay the same, just move the atoms of the displayed
+        # component instead of sending the whole structure to the viewer again.
+        if self._only_positions_changed(change["old"], change["new"]):
+            with self.hold_trait_notifications():
+                self.selection = list()
+                self._viewer.set_coordinates({0: self._ngl_positions(change["new"])})
+            return
+
         with self.hold_trait_notifications():
             for (
                 comp_id
             ) in self._viewer._ngl_component_ids:  # pylint: disable=protected-access
                 self._viewer.remove_component(comp_id)
+            self._highlighted = False
             self.selection = list()
             if change["new"] is not None:
                 self._viewer.add_component(nglview.ASEStructure(change["new"]))
                 self._viewer.clear()
-                self._viewer.add_ball_and_stick(
-                    aspectRatio=4
-                )  # pylint: disable=no-member
+                if len(change["new"]) > self.LARGE_STRUCTURE_NATOMS:
+                    # Bonds and detailed spheres are too expensive for big systems.
+                    self._viewer.add_spacefill(  # pylint: disable=no-member
+                        radiusScale=0.3, sphereDetail=0
+                    )
+                else:
+                    self._viewer.add_ball_and_stick(
+                        aspectRatio=4
+                    )  # pylint: disable=no-member
                 self._viewer.add_unitcell()  # pylint: disable=no-member
 
     def d_from(self, operand):
@@ -740,6 +863,7 @@ class StructureDataViewer(_StructureDataBaseViewer):
                 "function": intersec,
                 "priority": -1,
                 "nargs": 2,
+                "short_circuit": lambda opa: np.size(opa) == 0,
             },
             "or": {
                 "function": union,
@@ -868,10 +992,15 @@ class StructureDataViewer(_StructureDataBaseViewer):
         """ Apply the advanced boolean atom selection"""
         try:
             sel = self.parse_advanced_sel(condition=self.selection_adv)
-            self._selected_atoms.value = list_to_string_range(sel, shift=1)
+            sel = [int(i) for i in sel]
             self.wrong_syntax.layout.visibility = "hidden"
-            self.apply_selection()
-        except (IndexError, TypeError, AttributeError):
+            if sel == self.selection:
+                # _observe_selection won't be called, replace the expression by the
+                # range string here.
+                self._selected_atoms.value = list_to_string_range(sel, shift=1)
+            else:
+                self.selection = sel  # _observe_selection updates the text field.
+        except (IndexError, TypeError, AttributeError, ValueError):
             self.wrong_syntax.layout.visibility = "visible"
 
     @observe("selection")
@@ -915,24 +1044,17 @@ class FolderDataViewer(ipw.VBox):
 
     def download(self, change=None):  # pylint: disable=unused-argument
         """Prepare for downloading."""
-        from IPython.display import Javascript
-
-        payload = base64.b64encode(
-            self._folder.get_object_content(self.files.value).encode()
-        ).decode()
-        javas = Javascript(
-            """
-            var link = document.createElement('a');
-            link.href = "data:;base64,{payload}"
-            link.download = "{filename}"
-            document.body.appendChild(link);
-            link.click();
-            document.body.removeChild(link);
-            """.format(
-                payload=payload, filename=self.files.value
-            )
+        _download_text(
+            self._folder.get_object_content(self.files.value), self.files.value
         )
-        display(javas)
+
+
+@lru_cache(maxsize=32)
+def _bandplot_data(pk):
+    """Return the plot data of a stored BandsData node, which can't change anymore."""
+    return load_node(pk)._get_bandplot_data(
+        cartesian=True, join_symbol="|"
+    )  # pylint: disable=protected-access
 
 
 @register_viewer_widget("data.array.bands.BandsData.")
@@ -950,19 +1072,25 @@ class BandsDataViewer(ipw.VBox):
         output_notebook(hide_banner=True)
         out = ipw.Output()
         with out:
-            plot_info = bands._get_bandplot_data(
-                cartesian=True, join_symbol="|"
-            )  # pylint: disable=protected-access
+            if bands.is_stored:
+                plot_info = _bandplot_data(bands.pk)
+            else:
+                plot_info = bands._get_bandplot_data(
+                    cartesian=True, join_symbol="|"
+                )  # pylint: disable=protected-access
             # Extract relevant data
-            y_data = plot_info["y"].transpose().tolist()
-            x_data = [plot_info["x"] for i in range(len(y_data))]
+            # Bokeh accepts numpy arrays, each band is a view into the y array and
+            # all bands share the same x array.
+            y_data = list(plot_info["y"].transpose())
+            x_data = [plot_info["x"]] * len(y_data)
             labels = plot_info["labels"]
+            ticks = [label[0] for label in labels]
             # Create the figure
             plot = figure(y_axis_label="Dispersion ({})".format(bands.units))
             plot.multi_line(
                 x_data, y_data, line_width=2, line_color="red"
             )  # pylint: disable=too-many-function-args
-            plot.xaxis.ticker = [label[0] for label in labels]
+            plot.xaxis.ticker = ticks
             # This trick was suggested here: https://github.com/bokeh/bokeh/issues/8166#issuecomment-426124290
             plot.xaxis.major_label_overrides = {
                 int(label[0]) if label[0].is_integer() else label[0]: label[1]
@@ -972,12 +1100,12 @@ class BandsDataViewer(ipw.VBox):
             plot.renderers.extend(
                 [
                     Span(
-                        location=label[0],
+                        location=tick,
                         dimension="height",
                         line_color="black",
                         line_width=3,
                     )
-                    for label in labels
+                    for tick in ticks
                 ]
             )
             show(plot)
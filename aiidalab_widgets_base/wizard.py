@@ -4,10 +4,9 @@ Authors:
 
     * Carl Simon Adorf <simon.adorf@epfl.ch>
 """
+import asyncio
 from enum import Enum
-from time import sleep
 from time import time
-from threading import Thread
 
 import traitlets
 import ipywidgets as ipw
@@ -107,17 +106,15 @@ class WizardAppWidget(ipw.VBox):
 
         # Initialize the accordion with the widgets ...
         self.accordion = ipw.Accordion(children=widgets)
+        self._last_titles = [None] * len(widgets)
         self._update_titles()
         ipw.link((self.accordion, "selected_index"), (self, "selected_index"))
 
-        # Automatically update titles to implement the "spinner"
-
-        def spinner_thread():
-            while True:
-                sleep(0.1)
-                self._update_titles()
-
-        Thread(target=spinner_thread).start()
+        # Task animating the "spinner" of active steps, only runs while needed. The
+        # step states may change in other threads, so the task is always managed on
+        # the event loop of the thread (the kernel's) that created the widget.
+        self._loop = asyncio.get_event_loop()
+        self._spinner_task = None
 
         # Watch for changes to each step's state
         for widget in widgets:
@@ -127,6 +124,7 @@ class WizardAppWidget(ipw.VBox):
                     "It is expected that step classes are derived from the WizardAppWidgetStep class."
                 )
             widget.observe(self._update_step_state, names=["state"])
+        self._start_spinner()
 
         self.reset_button = ipw.Button(
             description="Reset",
@@ -164,9 +162,49 @@ class WizardAppWidget(ipw.VBox):
         super().__init__(children=[header, self.accordion], **kwargs)
 
     def _update_titles(self):
+        icons = self.icons()
         for i, (title, widget) in enumerate(zip(self.titles, self.accordion.children)):
-            icon = self.icons().get(widget.state, str(widget.state).upper())
-            self.accordion.set_title(i, f"{icon} Step {i+1}: {title}")
+            icon = icons.get(widget.state, str(widget.state).upper())
+            new_title = f"{icon} Step {i+1}: {title}"
+            # Only send the titles that actually changed to the frontend.
+            if self._last_titles[i] != new_title:
+                self.accordion.set_title(i, new_title)
+                self._last_titles[i] = new_title
+
+    def _any_active(self):
+        return any(
+            widget.state is WizardAppWidgetStep.State.ACTIVE
+            for widget in self.accordion.children
+        )
+
+    async def _spin(self):
+        """Animate the titles of active steps until no step is active anymore."""
+        try:
+            while self._any_active():
+                self._update_titles()
+                await asyncio.sleep(0.1)
+        finally:
+            self._spinner_task = None
+
+    def _start_spinner(self):
+        """Start animating the titles, can be called from any thread."""
+        if not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._create_spinner_task)
+
+    def _create_spinner_task(self):
+        if self._spinner_task is None and self._any_active():
+            self._spinner_task = self._loop.create_task(self._spin())
+
+    def _cancel_spinner_task(self):
+        if self._spinner_task is not None:
+            self._spinner_task.cancel()
+
+    def close(self):
+        """Stop animating the titles before closing the widget."""
+        # Also called on garbage collection, possibly after the loop was closed.
+        if not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._cancel_spinner_task)
+        super().close()
 
     def _consider_auto_advance(self, _=None):
         """Determine whether the app should automatically advance to the next step.
@@ -191,6 +229,7 @@ class WizardAppWidget(ipw.VBox):
             self._update_titles()
             self._update_buttons()
             self._consider_auto_advance()
+        self._start_spinner()
 
     @traitlets.observe("selected_index")
     def _observe_selected_index(self, change):
@@ -0,0 +1,2 @@
+"""Pytest configuration, importing the package requires an AiiDA profile."""
+pytest_plugins = ["aiida.manage.tests.pytest_fixtures"]
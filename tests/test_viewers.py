@@ -0,0 +1,72 @@
+"""Tests for the viewers module."""
+import base64
+from io import StringIO
+
+import numpy as np
+import pytest
+from ase import neighborlist
+from ase.build import bulk, molecule
+from ase.io import read, write
+
+
+@pytest.mark.usefixtures("aiida_profile")
+@pytest.mark.parametrize("formula", ["CH3CH2OH", "CH4", "C2H6", "C6H6"])
+def test_bonded_pairs(formula):
+    """The bonds of the rendering must be the ones found by ASE's NeighborList."""
+    from aiidalab_widgets_base.viewers import _StructureDataBaseViewer
+
+    atoms = molecule(formula)
+    reference = neighborlist.NeighborList(
+        neighborlist.natural_cutoffs(atoms), self_interaction=False, bothways=False
+    )
+    reference.update(atoms)
+    expected = sorted(reference.get_connectivity_matrix().keys())
+
+    assert sorted(_StructureDataBaseViewer._bonded_pairs(atoms)) == expected
+
+
+@pytest.mark.usefixtures("aiida_profile")
+def test_structure_download_formats(tmp_path):
+    """Every format offered for download is written and can be read back."""
+    from aiidalab_widgets_base.viewers import StructureDataViewer
+
+    structure = bulk("Si", "diamond", a=5.43)
+    widget = StructureDataViewer(structure=structure)
+
+    for file_format in widget.file_format.options:
+        path = tmp_path / f"structure.{file_format}"
+        path.write_bytes(base64.b64decode(widget._prepare_payload(file_format)))
+        atoms = read(str(path), format=file_format)
+        assert atoms.get_chemical_symbols() == structure.get_chemical_symbols()
+
+
+@pytest.mark.usefixtures("aiida_profile")
+def test_ngl_positions_rotated_cell():
+    """Moved atoms must be sent to NGL in the frame of the PDB it was loaded from."""
+    from aiidalab_widgets_base.viewers import StructureDataViewer
+
+    # The primitive fcc cell is not in the standard orientation of the PDB format.
+    structure = bulk("Si").repeat(2)
+    structure.positions[0] += [0.3, 0.1, 0.0]
+
+    pdb = StringIO()
+    write(pdb, structure, format="proteindatabank")
+    pdb.seek(0)
+    expected = read(pdb, format="proteindatabank").positions
+
+    positions = StructureDataViewer._ngl_positions(structure)
+    assert np.allclose(positions, expected, atol=1e-3)
+
+
+@pytest.mark.usefixtures("aiida_profile")
+@pytest.mark.parametrize("expression", ["H", "Si", "not C"])
+def test_advanced_selection_wrong_syntax(expression):
+    """Expressions that don't evaluate to atom indices are reported as wrong syntax."""
+    from aiidalab_widgets_base.viewers import StructureDataViewer
+
+    widget = StructureDataViewer(structure=molecule("CH4"))
+    widget.selection = [0]
+    widget.selection_adv = expression
+
+    assert widget.wrong_syntax.layout.visibility == "visible"
+    assert widget.selection == [0]